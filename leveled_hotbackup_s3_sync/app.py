@@ -1,40 +1,145 @@
 import argparse
+import multiprocessing
 import os
 import os.path
 import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Union
 
 from leveled_hotbackup_s3_sync.config import read_config
+from leveled_hotbackup_s3_sync.fileio import configure_reads
 from leveled_hotbackup_s3_sync.journal import (
+    all_journals_uploaded,
+    list_existing_journals,
     maybe_download_journal,
-    maybe_upload_journal,
     update_journal_filename,
 )
+from leveled_hotbackup_s3_sync.ledger import LEDGER_FILENAME, UploadLedger
 from leveled_hotbackup_s3_sync.manifest import (
     read_manifest,
     save_local_manifest,
     upload_new_manifest,
 )
-from leveled_hotbackup_s3_sync.utils import get_owned_partitions
+from leveled_hotbackup_s3_sync.pipeline import BackupPipeline
+from leveled_hotbackup_s3_sync.utils import (
+    configure_rate_limits,
+    configure_s3_clients,
+    configure_s3_transfers,
+    get_owned_partitions,
+)
+
+
+def wait_for_journals(futures: List[Future]) -> None:
+    # Workers buffer their messages so they are printed in manifest order
+    for future in futures:
+        for message in future.result():
+            print(message)
+
+
+def configure_s3(config: dict) -> None:
+    # Every worker may run a multipart transfer, and the in-flight budget is shared between them
+    configure_s3_clients(config["workers"] * config["transfer_concurrency"])
+    max_inflight_bytes = config["max_inflight_bytes"]
+    configure_s3_transfers(
+        config["multipart_chunksize"],
+        config["adaptive_chunksize"],
+        config["transfer_concurrency"],
+        max_inflight_bytes // config["workers"] if max_inflight_bytes else None,
+    )
+    configure_rate_limits(config["max_bandwidth"], config["max_requests"], config["rate_limit_schedule"])
+
+
+def device_read_share(config: dict) -> Union[int, None]:
+    # Hints processes scan journals while this process uploads them, and each
+    # process keeps its own budget, so the per device cap is split between them
+    max_device_read_bandwidth = config["max_device_read_bandwidth"]
+    if max_device_read_bandwidth is None or not config["hints_files"]:
+        return max_device_read_bandwidth
+    return max(1, max_device_read_bandwidth // (config["hints_workers"] + 1))
+
+
+def open_ledger(config: dict) -> Union[UploadLedger, None]:
+    if not config["upload_ledger"]:
+        return None
+    return UploadLedger(os.path.join(config["hotbackup_path"], LEDGER_FILENAME), config["ledger_reconcile_days"])
+
+
+def open_hints_executor(config: dict) -> Union[ProcessPoolExecutor, None]:
+    if not config["hints_files"]:
+        return None
+    # Building hints is CPU bound, so it runs in worker processes. These are spawned rather
+    # than forked as this process already has transfer threads running.
+    return ProcessPoolExecutor(
+        max_workers=config["hints_workers"],
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=configure_reads,
+        initargs=(config["io_mode"], device_read_share(config)),
+    )
 
 
 def backup(config: dict) -> None:
+    configure_s3(config)
+    configure_reads(config["io_mode"], device_read_share(config))
+    ledger = open_ledger(config)
+    hints_executor = open_hints_executor(config)
+    try:
+        backup_partitions(config, ledger, hints_executor)
+        if ledger is not None:
+            ledger.mark_reconciled()
+    finally:
+        if hints_executor is not None:
+            hints_executor.shutdown()
+        if ledger is not None:
+            ledger.close()
+
+
+def backup_partitions(
+    config: dict, ledger: Union[UploadLedger, None], hints_executor: Union[ProcessPoolExecutor, None]
+) -> None:
     partitions = get_owned_partitions(config["ring_filename"])
-    for partition in partitions:
-        manifest_filename = os.path.join(config["hotbackup_path"], str(partition), "journal/journal_manifest/0.man")
-        print(f"Starting to process {manifest_filename}")
-        manifest = read_manifest(manifest_filename)
+    pipeline = BackupPipeline(config, ledger, hints_executor)
+    pending: list = []
+    try:
+        for partition in partitions:
+            manifest_filename = os.path.join(config["hotbackup_path"], str(partition), "journal/journal_manifest/0.man")
+            manifest = read_manifest(manifest_filename)
+            if all_journals_uploaded(manifest, config["hotbackup_path"], config["s3_path"], ledger):
+                existing: dict = {}
+            else:
+                existing = list_existing_journals(
+                    manifest, config["hotbackup_path"], config["s3_path"], config["s3_endpoint"]
+                )
+            futures = [pipeline.submit(journal, existing) for journal in manifest]
+            pending.append((partition, manifest_filename, manifest, futures))
+            commit_partitions(config, pending, wait=False)
+        commit_partitions(config, pending, wait=True)
+    except BaseException:
+        pipeline.stop()
+        raise
+    finally:
+        pipeline.close()
+    for line in pipeline.report():
+        print(line)
 
-        new_manifest = []
-        for journal in manifest:
-            maybe_upload_journal(
-                journal, config["hotbackup_path"], config["s3_path"], config["hints_files"], config["s3_endpoint"]
-            )
-            new_manifest.append(update_journal_filename(journal, config["hotbackup_path"], config["s3_path"]))
 
+def commit_partitions(config: dict, pending: list, wait: bool) -> None:
+    # Partitions are committed in ring order, and each manifest is only
+    # uploaded once every journal it references has been confirmed in S3
+    while pending:
+        partition, manifest_filename, manifest, futures = pending[0]
+        if not wait and not all(future.done() for future in futures):
+            return
+        pending.pop(0)
+        print(f"Starting to process {manifest_filename}")
+        wait_for_journals(futures)
+        new_manifest = [
+            update_journal_filename(journal, config["hotbackup_path"], config["s3_path"]) for journal in manifest
+        ]
         upload_new_manifest(new_manifest, str(partition), config["s3_path"], config["tag"], config["s3_endpoint"])
 
 
 def restore(config: dict) -> None:
+    configure_s3(config)
     partitions = get_owned_partitions(config["ring_filename"])
     for partition in partitions:
         manifest_s3_path = os.path.join(
@@ -43,9 +148,11 @@ def restore(config: dict) -> None:
         print(f"Starting to process {manifest_s3_path}")
         manifest = read_manifest(manifest_s3_path, config["s3_endpoint"])
 
+        existing = list_existing_journals(manifest, config["s3_path"], config["s3_path"], config["s3_endpoint"])
+
         new_manifest = []
         for journal in manifest:
-            maybe_download_journal(journal, config["s3_path"], config["leveled_path"], config["s3_endpoint"])
+            maybe_download_journal(journal, config["s3_path"], config["leveled_path"], config["s3_endpoint"], existing)
             new_manifest.append(update_journal_filename(journal, config["s3_path"], config["leveled_path"]))
         manifest_filename = os.path.join(config["leveled_path"], str(partition), "journal/journal_manifest/0.man")
         save_local_manifest(new_manifest, manifest_filename)
@@ -2,7 +2,16 @@ import os
 import sys
 from urllib.parse import urlparse
 
-from leveled_hotbackup_s3_sync.utils import find_latest_ring
+from leveled_hotbackup_s3_sync.fileio import IO_MODES
+from leveled_hotbackup_s3_sync.hints import HINTS_SPOOL_MAX_SIZE
+from leveled_hotbackup_s3_sync.ratelimit import parse_time_of_day
+from leveled_hotbackup_s3_sync.utils import (
+    MAX_MULTIPART_CHUNKSIZE,
+    MIN_MULTIPART_CHUNKSIZE,
+    MULTIPART_CHUNKSIZE,
+    TRANSFER_CONCURRENCY,
+    find_latest_ring,
+)
 
 if sys.version_info >= (3, 11):
     import tomllib
@@ -31,13 +40,71 @@ def check_directory(path: str) -> str:
     return parsed_path
 
 
+def check_positive_int(value: int) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{value} is not a positive integer")
+    return value
+
+
+def check_multipart_chunksize(value: int) -> int:
+    check_positive_int(value)
+    if not MIN_MULTIPART_CHUNKSIZE <= value <= MAX_MULTIPART_CHUNKSIZE:
+        raise ValueError(
+            f"{value} is not a valid multipart chunk size, "
+            f"must be between {MIN_MULTIPART_CHUNKSIZE} and {MAX_MULTIPART_CHUNKSIZE} bytes"
+        )
+    return value
+
+
+def check_io_mode(value: str) -> str:
+    if value not in IO_MODES:
+        raise ValueError(f"{value} is not a valid io_mode, must be one of {', '.join(IO_MODES)}")
+    return value
+
+
+def check_rate_limit_schedule(schedule: list) -> list:
+    if not isinstance(schedule, list):
+        raise ValueError("rate_limit_schedule must be a list of tables")
+    parsed = []
+    for window in schedule:
+        if not isinstance(window, dict) or "start" not in window or "end" not in window:
+            raise ValueError("each rate_limit_schedule entry needs a start and an end time")
+        unknown = set(window) - {"start", "end", "max_bandwidth", "max_requests"}
+        if unknown:
+            raise ValueError(f"unknown rate_limit_schedule settings: {', '.join(sorted(unknown))}")
+        parsed_window: dict = {
+            "start": parse_time_of_day(window["start"]),
+            "end": parse_time_of_day(window["end"]),
+        }
+        for limit in ("max_bandwidth", "max_requests"):
+            if limit in window:
+                parsed_window[limit] = check_positive_int(window[limit])
+        parsed.append(parsed_window)
+    return parsed
+
+
 CONFIG_PARAMETERS = {
     "hotbackup_path": {"required": True, "type": check_directory},
     "ring_path": {"required": True, "type": check_directory},
     "leveled_path": {"required": True, "type": check_directory},
     "s3_path": {"required": True, "type": check_s3_url},
     "hints_files": {"required": False, "type": bool, "default": False},
+    "hints_workers": {"required": False, "type": check_positive_int, "default": 1},
+    "hints_spool_max_size": {"required": False, "type": check_positive_int, "default": HINTS_SPOOL_MAX_SIZE},
+    "scratch_path": {"required": False, "type": check_directory, "default": None},
     "s3_endpoint": {"required": False, "type": check_endpoint_url, "default": None},
+    "workers": {"required": False, "type": check_positive_int, "default": 4},
+    "upload_ledger": {"required": False, "type": bool, "default": False},
+    "ledger_reconcile_days": {"required": False, "type": check_positive_int, "default": 7},
+    "multipart_chunksize": {"required": False, "type": check_multipart_chunksize, "default": MULTIPART_CHUNKSIZE},
+    "adaptive_chunksize": {"required": False, "type": bool, "default": False},
+    "transfer_concurrency": {"required": False, "type": check_positive_int, "default": TRANSFER_CONCURRENCY},
+    "max_inflight_bytes": {"required": False, "type": check_positive_int, "default": None},
+    "max_bandwidth": {"required": False, "type": check_positive_int, "default": None},
+    "max_requests": {"required": False, "type": check_positive_int, "default": None},
+    "rate_limit_schedule": {"required": False, "type": check_rate_limit_schedule, "default": []},
+    "io_mode": {"required": False, "type": check_io_mode, "default": "default"},
+    "max_device_read_bandwidth": {"required": False, "type": check_positive_int, "default": None},
 }
 
 
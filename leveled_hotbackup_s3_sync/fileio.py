@@ -0,0 +1,149 @@
+import ctypes
+import ctypes.util
+import io
+import mmap
+import os
+import threading
+from typing import Union
+
+from leveled_hotbackup_s3_sync.ratelimit import TokenBucket
+
+IO_MODES = ("default", "nocache")
+
+# How far reads get ahead of the last page cache drop in nocache mode
+DROP_BEHIND_SIZE = 8 * 1024 * 1024
+
+READ_SETTINGS: dict = {"io_mode": "default", "max_device_read_bandwidth": None}
+DEVICE_BUCKETS: dict = {}
+DEVICE_BUCKETS_LOCK = threading.Lock()
+
+PAGE_SIZE = mmap.PAGESIZE
+MAP_FAILED = (1 << (8 * ctypes.sizeof(ctypes.c_void_p))) - 1
+
+
+def load_libc():
+    # mincore is used to tell which pages were already cached, and needs libc
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_char_p]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+LIBC = load_libc()
+
+
+def configure_reads(io_mode: str, max_device_read_bandwidth: Union[int, None]) -> None:
+    with DEVICE_BUCKETS_LOCK:
+        READ_SETTINGS["io_mode"] = io_mode
+        READ_SETTINGS["max_device_read_bandwidth"] = max_device_read_bandwidth
+        DEVICE_BUCKETS.clear()
+
+
+def managed_reads() -> bool:
+    return READ_SETTINGS["io_mode"] != "default" or READ_SETTINGS["max_device_read_bandwidth"] is not None
+
+
+def get_device_bucket(device: int) -> TokenBucket:
+    # Journals on the same block device share one read budget
+    with DEVICE_BUCKETS_LOCK:
+        if device not in DEVICE_BUCKETS:
+            DEVICE_BUCKETS[device] = TokenBucket(READ_SETTINGS["max_device_read_bandwidth"])
+        return DEVICE_BUCKETS[device]
+
+
+def advise(file_descriptor: int, offset: int, length: int, advice: str) -> None:
+    # posix_fadvise is only a hint, and is not available on every platform
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(file_descriptor, offset, length, getattr(os, advice))
+
+
+def resident_pages(file_descriptor: int, first_page: int, num_pages: int) -> Union[bytes, None]:
+    # One byte per page, with the low bit set if the page is in the page cache,
+    # or None if that cannot be found out on this platform
+    if LIBC is None or num_pages <= 0:
+        return None
+    length = num_pages * PAGE_SIZE
+    address = LIBC.mmap(None, length, mmap.PROT_READ, mmap.MAP_SHARED, file_descriptor, first_page * PAGE_SIZE)
+    if address in (None, MAP_FAILED):
+        return None
+    try:
+        pages = ctypes.create_string_buffer(num_pages)
+        if LIBC.mincore(address, length, pages) != 0:
+            return None
+        return pages.raw
+    finally:
+        LIBC.munmap(address, length)
+
+
+class BackupReader(io.FileIO):
+    # Reads a file for backup without pushing the live node's data out of the page cache:
+    # in nocache mode the kernel is told the file is read sequentially, and pages this
+    # reader brought into the cache are dropped once they have been read. Hotbackup
+    # journals are hard links to the live journals, so pages which were already cached
+    # belong to the node and are left alone. Reads are also throttled per block device.
+    def __init__(self, filename: str):
+        super().__init__(filename, "rb")
+        self.bucket = get_device_bucket(os.fstat(self.fileno()).st_dev)
+        self.drop_cache = READ_SETTINGS["io_mode"] == "nocache"
+        # Pages found in the cache before they were read, and how far that has been checked
+        self.cached = bytearray()
+        self.checked_pages = 0
+        self.dropped = 0
+        if self.drop_cache:
+            advise(self.fileno(), 0, 0, "POSIX_FADV_SEQUENTIAL")
+
+    def read(self, size: Union[int, None] = -1) -> bytes:
+        if size is None or size < 0:
+            size = max(0, os.fstat(self.fileno()).st_size - self.tell())
+        self.bucket.acquire(size)
+        self.check_cached(size)
+        data = super().read(size)
+        self.drop_behind()
+        return data
+
+    def readinto(self, buffer) -> Union[int, None]:
+        self.bucket.acquire(len(buffer))
+        self.check_cached(len(buffer))
+        num_bytes = super().readinto(buffer)
+        self.drop_behind()
+        return num_bytes
+
+    def check_cached(self, size: int) -> None:
+        if not self.drop_cache:
+            return
+        end_page = min(-(-(self.tell() + size) // PAGE_SIZE), -(-os.fstat(self.fileno()).st_size // PAGE_SIZE))
+        if end_page <= self.checked_pages:
+            return
+        pages = resident_pages(self.fileno(), self.checked_pages, end_page - self.checked_pages)
+        # Without mincore every page is treated as unknown, and only the drop-behind windows are dropped
+        self.cached.extend(bytes(page & 1 for page in pages) if pages else bytes(end_page - self.checked_pages))
+        self.checked_pages = end_page
+
+    def drop_behind(self, final: bool = False) -> None:
+        if not self.drop_cache:
+            return
+        position = self.tell()
+        self.dropped = min(self.dropped, position)
+        if final or position - self.dropped >= DROP_BEHIND_SIZE:
+            # Only whole pages which have been read, and only those this reader brought in
+            end_page = min(-(-position // PAGE_SIZE) if final else position // PAGE_SIZE, self.checked_pages)
+            page = self.dropped // PAGE_SIZE
+            while page < end_page:
+                if self.cached[page]:
+                    page += 1
+                    continue
+                run_start = page
+                while page < end_page and not self.cached[page]:
+                    page += 1
+                advise(self.fileno(), run_start * PAGE_SIZE, (page - run_start) * PAGE_SIZE, "POSIX_FADV_DONTNEED")
+            self.dropped = max(self.dropped, end_page * PAGE_SIZE)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.drop_behind(final=True)
+        super().close()
@@ -1,19 +1,147 @@
-from typing import Union
+import io
+import os
+import tempfile
+from typing import BinaryIO, Iterable, Tuple, Union
 
 import cdblib
 
 from leveled_hotbackup_s3_sync import erlang
 
+HINTS_SPOOL_MAX_SIZE = 64 * 1024 * 1024
 
-def create_hints_file(filename: str, journal_keys: list) -> None:
+# A journal key is {SQN, Type, {o_rkv, Bucket, Key, null}} in External Term Format,
+# and a hints key is {Bucket, Key}, so hints keys can be sliced out of journal keys
+# without decoding them. Anything unexpected falls back to a full decode.
+JOURNAL_KEY_PREFIX = bytes([131, 104, 3])
+LEDGER_KEY_PREFIX = bytes([104, 4])
+HINTS_KEY_PREFIX = bytes([131, 104, 2])
+
+
+class SpooledHintsFile:
+    # Holds a hints file in memory, spilling to a named file in scratch_dir once it grows past
+    # max_size. Unlike tempfile.SpooledTemporaryFile, the spilled file can be handed to another
+    # process for upload.
+    def __init__(self, max_size: int, scratch_dir: Union[str, None] = None):
+        self.max_size = max_size
+        self.scratch_dir = scratch_dir
+        self.file: BinaryIO = io.BytesIO()
+        self.filename: Union[str, None] = None
+
+    def write(self, data: bytes) -> int:
+        if self.filename is None and self.file.tell() + len(data) > self.max_size:
+            self.spill()
+        return self.file.write(data)
+
+    def spill(self) -> None:
+        handle, self.filename = tempfile.mkstemp(suffix=".hints.cdb", dir=self.scratch_dir)
+        spilled = os.fdopen(handle, "w+b")
+        spilled.write(self.file.getvalue())  # type: ignore
+        spilled.seek(self.file.tell())
+        self.file = spilled
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def result(self) -> Union[bytes, str]:
+        if self.filename is None:
+            return self.file.getvalue()  # type: ignore
+        self.file.close()
+        return self.filename
+
+    def discard(self) -> None:
+        self.file.close()
+        if self.filename is not None:
+            os.remove(self.filename)
+
+
+def create_hints_file(filename: str, journal_keys: Iterable) -> None:
     with open(filename, "wb") as file_handle:
-        with cdblib.Writer(file_handle) as writer:
-            for k in journal_keys:
-                sqn = k[0]
-                bucket = k[2][1]
-                bkey = k[2][2]
-                cdb_key = erlang.term_to_binary((bucket, bkey))
-                writer.putint(cdb_key, sqn)
+        write_hints(file_handle, journal_keys)
+
+
+def build_hints(
+    journal_keys: Iterable, max_size: int = HINTS_SPOOL_MAX_SIZE, scratch_dir: Union[str, None] = None
+) -> Union[bytes, str]:
+    # Returns the hints file itself, or the name of the scratch file it spilled to
+    spool = SpooledHintsFile(max_size, scratch_dir)
+    try:
+        write_hints(spool, journal_keys)
+    except BaseException:
+        spool.discard()
+        raise
+    return spool.result()
+
+
+def write_hints(file_handle: Union[BinaryIO, SpooledHintsFile], journal_keys: Iterable) -> None:
+    # Entries are written as they arrive, so journal keys can be streamed in
+    with cdblib.Writer(file_handle) as writer:
+        for journal_key in journal_keys:
+            sqn, cdb_key = hints_entry(journal_key)
+            writer.putint(cdb_key, sqn)
+
+
+def hints_entry(journal_key: Union[bytes, tuple]) -> Tuple[int, bytes]:
+    if isinstance(journal_key, bytes):
+        try:
+            return slice_hints_entry(journal_key)
+        except (ValueError, IndexError):
+            journal_key = erlang.binary_to_term(journal_key)
+    sqn = journal_key[0]  # type: ignore
+    bucket = journal_key[2][1]  # type: ignore
+    bkey = journal_key[2][2]  # type: ignore
+    return sqn, erlang.term_to_binary((bucket, bkey))
+
+
+def slice_hints_entry(journal_key: bytes) -> Tuple[int, bytes]:
+    if not journal_key.startswith(JOURNAL_KEY_PREFIX):
+        raise ValueError("Unexpected journal key format")
+    sqn, pos = decode_integer(journal_key, len(JOURNAL_KEY_PREFIX))
+    pos = skip_atom(journal_key, pos)
+    if journal_key[pos : pos + 2] != LEDGER_KEY_PREFIX:
+        raise ValueError("Unexpected journal key format")
+    pos = skip_atom(journal_key, pos + 2)
+    bucket_start = pos
+    if journal_key[pos] == 104 and journal_key[pos + 1] == 2:
+        pos = skip_binary(journal_key, pos + 2)
+    pos = skip_binary(journal_key, pos)
+    bkey_end = skip_binary(journal_key, pos)
+    if skip_atom(journal_key, bkey_end) != len(journal_key):
+        raise ValueError("Unexpected journal key format")
+    return sqn, HINTS_KEY_PREFIX + journal_key[bucket_start:bkey_end]
+
+
+def decode_integer(data: bytes, pos: int) -> Tuple[int, int]:
+    tag = data[pos]
+    if tag == 97:
+        return data[pos + 1], pos + 2
+    if tag == 98:
+        return int.from_bytes(data[pos + 1 : pos + 5], "big", signed=True), pos + 5
+    if tag == 110:
+        length = data[pos + 1]
+        value = int.from_bytes(data[pos + 3 : pos + 3 + length], "little")
+        return (-value if data[pos + 2] else value), pos + 3 + length
+    raise ValueError("Unexpected integer encoding")
+
+
+def skip_atom(data: bytes, pos: int) -> int:
+    tag = data[pos]
+    if tag in (100, 118):
+        return pos + 3 + int.from_bytes(data[pos + 1 : pos + 3], "big")
+    if tag in (115, 119):
+        return pos + 2 + data[pos + 1]
+    raise ValueError("Unexpected atom encoding")
+
+
+def skip_binary(data: bytes, pos: int) -> int:
+    if data[pos] != 109:
+        raise ValueError("Unexpected binary encoding")
+    end = pos + 5 + int.from_bytes(data[pos + 1 : pos + 5], "big")
+    if end > len(data):
+        raise ValueError("Unexpected binary encoding")
+    return end
 
 
 def get_sqn(reader: cdblib.Reader, bucket: bytes, bkey: bytes, buckettype: Union[bytes, None] = None) -> int:
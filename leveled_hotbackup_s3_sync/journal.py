@@ -1,25 +1,63 @@
+import io
 import os
+import struct
 import zlib
-from typing import Union
+from concurrent.futures import Executor
+from typing import Callable, Iterator, Union
 
 import cdblib
 import lz4.block
 
 from leveled_hotbackup_s3_sync import erlang
-from leveled_hotbackup_s3_sync.hints import create_hints_file
+from leveled_hotbackup_s3_sync.fileio import BackupReader, managed_reads
+from leveled_hotbackup_s3_sync.hints import HINTS_SPOOL_MAX_SIZE, build_hints
+from leveled_hotbackup_s3_sync.ledger import UploadLedger
 from leveled_hotbackup_s3_sync.utils import (
     download_file_from_s3,
     ensure_parent_dir_exists,
+    format_throughput,
+    list_s3_objects,
     local_path_exists,
     s3_path_exists,
     swap_path,
     upload_file_to_s3,
+    upload_fileobj_to_s3,
 )
 
+CDB_HEADER = struct.Struct("<512L")
+CDB_RECORD_HEADER = struct.Struct("<LL")
+STREAM_BUFFER_SIZE = 1024 * 1024
 
-def list_keys(filename: str) -> list:
+
+def iter_keys(filename: str, decode: bool = True) -> Iterator:
+    if managed_reads():
+        for journal_key in stream_keys(filename):
+            yield erlang.binary_to_term(journal_key) if decode else journal_key
+        return
     with cdblib.Reader.from_file_path(filename) as reader:
-        return [erlang.binary_to_term(x) for x in reader.keys()]
+        for journal_key in reader.iterkeys():
+            yield erlang.binary_to_term(journal_key) if decode else journal_key
+
+
+def stream_keys(filename: str) -> Iterator[bytes]:
+    # Walks the records in file order with buffered reads rather than mmap, so the
+    # reads can be throttled and dropped from the page cache, and values are skipped
+    with io.BufferedReader(BackupReader(filename), STREAM_BUFFER_SIZE) as file_handle:
+        header = file_handle.read(CDB_HEADER.size)
+        if len(header) != CDB_HEADER.size:
+            raise ValueError(f"{filename} is not a CDB file")
+        table_start = min(CDB_HEADER.unpack(header)[::2])
+        pos = CDB_HEADER.size
+        while pos < table_start:
+            klen, dlen = CDB_RECORD_HEADER.unpack(file_handle.read(CDB_RECORD_HEADER.size))
+            journal_key = file_handle.read(klen)
+            file_handle.seek(dlen, io.SEEK_CUR)
+            pos += CDB_RECORD_HEADER.size + klen + dlen
+            yield journal_key
+
+
+def list_keys(filename: str) -> list:
+    return list(iter_keys(filename))
 
 
 def decode_journal_object(journal_key: bytes, journal_obj: bytes):
@@ -51,33 +89,120 @@ def decode_valuetype(value_type: int) -> tuple:
     return is_binary, is_compressed, is_lz4
 
 
+def create_journal_hints(
+    journal_filename: str, spool_max_size: int = HINTS_SPOOL_MAX_SIZE, scratch_dir: Union[str, None] = None
+) -> Union[bytes, str]:
+    return build_hints(iter_keys(journal_filename, decode=False), spool_max_size, scratch_dir)
+
+
+def build_journal_hints(
+    journal_filename: str,
+    hints_executor: Union[Executor, None],
+    spool_max_size: int = HINTS_SPOOL_MAX_SIZE,
+    scratch_dir: Union[str, None] = None,
+) -> Union[bytes, str]:
+    if hints_executor is None:
+        return create_journal_hints(journal_filename, spool_max_size, scratch_dir)
+    return hints_executor.submit(create_journal_hints, journal_filename, spool_max_size, scratch_dir).result()
+
+
+def journal_is_uploaded(
+    journal_filename: str,
+    journal_s3_path: str,
+    endpoint: Union[str, None],
+    existing: Union[dict, None] = None,
+    ledger: Union[UploadLedger, None] = None,
+) -> bool:
+    if ledger is not None and ledger.is_uploaded(journal_filename, journal_s3_path):
+        return True
+    if existing is None:
+        return s3_path_exists(journal_s3_path, endpoint)
+    return journal_s3_path in existing and existing[journal_s3_path]["size"] == os.path.getsize(journal_filename)
+
+
+def upload_journal_hints(
+    hints: Union[bytes, str], hints_s3_path: str, endpoint: Union[str, None], output: Callable[[str], None] = print
+) -> None:
+    if isinstance(hints, bytes):
+        output(f"Uploading hints from memory to {hints_s3_path}")
+        upload_fileobj_to_s3(io.BytesIO(hints), len(hints), hints_s3_path, endpoint)
+        return
+
+    try:
+        output(f"Uploading {hints} to {hints_s3_path}")
+        upload_file_to_s3(hints, hints_s3_path, endpoint)
+    finally:
+        output(f"Deleting scratch copy of {hints}")
+        os.remove(hints)
+
+
+def upload_journal_file(
+    journal_filename: str, journal_s3_path: str, endpoint: Union[str, None], output: Callable[[str], None] = print
+) -> None:
+    output(f"Uploading {journal_filename} to {journal_s3_path}")
+    if managed_reads():
+        with BackupReader(journal_filename) as file_handle:
+            elapsed = upload_fileobj_to_s3(file_handle, os.path.getsize(journal_filename), journal_s3_path, endpoint)
+    else:
+        elapsed = upload_file_to_s3(journal_filename, journal_s3_path, endpoint)
+    output(f"Uploaded {journal_filename}: {format_throughput(os.path.getsize(journal_filename), elapsed)}")
+
+
 def maybe_upload_journal(
-    journal: tuple, source: str, destination: str, create_hints_files: bool, endpoint: Union[str, None]
+    journal: tuple,
+    source: str,
+    destination: str,
+    create_hints_files: bool,
+    endpoint: Union[str, None],
+    existing: Union[dict, None] = None,
+    ledger: Union[UploadLedger, None] = None,
+    hints_executor: Union[Executor, None] = None,
+    hints_spool_max_size: int = HINTS_SPOOL_MAX_SIZE,
+    scratch_dir: Union[str, None] = None,
+    output: Callable[[str], None] = print,
 ) -> None:
+    # pylint: disable=too-many-arguments
     journal_filename = f"{journal[1].decode('utf-8')}.cdb"
     journal_s3_path = swap_path(journal_filename, source, destination)
 
-    if s3_path_exists(journal_s3_path, endpoint):
-        print(f"{journal_s3_path} already exists")
+    if journal_is_uploaded(journal_filename, journal_s3_path, endpoint, existing, ledger):
+        output(f"{journal_s3_path} already exists")
     else:
         if create_hints_files:
-            hints_filename = f"{journal[1].decode('utf-8')}.hints.cdb"
-            hints_s3_path = swap_path(hints_filename, source, destination)
+            hints_s3_path = swap_path(f"{journal[1].decode('utf-8')}.hints.cdb", source, destination)
+            hints = build_journal_hints(journal_filename, hints_executor, hints_spool_max_size, scratch_dir)
+            upload_journal_hints(hints, hints_s3_path, endpoint, output)
+
+        upload_journal_file(journal_filename, journal_s3_path, endpoint, output)
 
-            journal_keys = list_keys(journal_filename)
-            create_hints_file(hints_filename, journal_keys)
+    if ledger is not None:
+        ledger.record_upload(journal_filename, journal_s3_path)
 
-            print(f"Uploading {hints_filename} to {hints_s3_path}")
-            upload_file_to_s3(hints_filename, hints_s3_path, endpoint)
 
-            print(f"Deleting local copy of {hints_filename}")
-            os.remove(hints_filename)
+def all_journals_uploaded(manifest: list, source: str, destination: str, ledger: Union[UploadLedger, None]) -> bool:
+    if ledger is None:
+        return False
+    for journal in manifest:
+        journal_filename = f"{journal[1].decode('utf-8')}.cdb"
+        if not ledger.is_uploaded(journal_filename, swap_path(journal_filename, source, destination)):
+            return False
+    return True
 
-        print(f"Uploading {journal_filename} to {journal_s3_path}")
-        upload_file_to_s3(journal_filename, journal_s3_path, endpoint)
 
+def list_existing_journals(manifest: list, source: str, destination: str, endpoint: Union[str, None]) -> dict:
+    # One paginated listing per journal directory replaces a HEAD request per journal
+    prefixes = {
+        os.path.dirname(swap_path(f"{journal[1].decode('utf-8')}.cdb", source, destination)) for journal in manifest
+    }
+    existing = {}
+    for prefix in sorted(prefixes):
+        existing.update(list_s3_objects(f"{prefix}/", endpoint))
+    return existing
 
-def maybe_download_journal(journal: tuple, source: str, destination: str, endpoint: Union[str, None]) -> None:
+
+def maybe_download_journal(
+    journal: tuple, source: str, destination: str, endpoint: Union[str, None], existing: Union[dict, None] = None
+) -> None:
     journal_filename = f"{journal[1].decode('utf-8')}.cdb"
     journal_local_path = swap_path(journal_filename, source, destination)
 
@@ -86,7 +211,10 @@ def maybe_download_journal(journal: tuple, source: str, destination: str, endpoi
     else:
         print(f"Downloading {journal_filename} to {journal_local_path}")
         ensure_parent_dir_exists(journal_local_path)
-        download_file_from_s3(journal_filename, journal_local_path, endpoint)
+        # The size from the listing lets adaptive chunk sizes apply to downloads too
+        size = existing[journal_filename]["size"] if existing and journal_filename in existing else None
+        elapsed = download_file_from_s3(journal_filename, journal_local_path, endpoint, size)
+        print(f"Downloaded {journal_filename}: {format_throughput(os.path.getsize(journal_local_path), elapsed)}")
 
 
 def update_journal_filename(journal: tuple, source: str, destination: str) -> tuple:
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import threading
+import time
+
+LEDGER_FILENAME = "s3sync_ledger.db"
+SECONDS_PER_DAY = 86400
+
+
+class UploadLedger:
+    def __init__(self, filename: str, reconcile_days: int):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS uploads "
+                "(local_path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, s3_path TEXT)"
+            )
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL)")
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'last_reconciled'").fetchone()
+        last_reconciled = row[0] if row else 0.0
+        # Every so often the ledger is not trusted, so each journal is checked against S3 again
+        self.reconciling = time.time() - last_reconciled >= reconcile_days * SECONDS_PER_DAY
+
+    def is_uploaded(self, local_path: str, s3_path: str) -> bool:
+        if self.reconciling:
+            return False
+        stat = os.stat(local_path)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, inode, s3_path FROM uploads WHERE local_path = ?", (local_path,)
+            ).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns, stat.st_ino, s3_path)
+
+    def record_upload(self, local_path: str, s3_path: str) -> None:
+        stat = os.stat(local_path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?)",
+                (local_path, stat.st_size, stat.st_mtime_ns, stat.st_ino, s3_path),
+            )
+
+    def mark_reconciled(self) -> None:
+        if self.reconciling:
+            with self.lock, self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('last_reconciled', ?)", (time.time(),))
+            self.reconciling = False
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,163 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Union
+
+from leveled_hotbackup_s3_sync.journal import (
+    build_journal_hints,
+    journal_is_uploaded,
+    upload_journal_file,
+    upload_journal_hints,
+)
+from leveled_hotbackup_s3_sync.ledger import UploadLedger
+from leveled_hotbackup_s3_sync.utils import swap_path
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, busy: float, blocked: float = 0.0) -> None:
+        with self.lock:
+            self.items += 1
+            self.busy += busy
+            self.blocked += blocked
+
+    def report(self, elapsed: float) -> str:
+        utilisation = 100 * self.busy / (elapsed * self.workers) if elapsed > 0 else 0.0
+        return (
+            f"Stage {self.name}: {self.items} journals, {self.busy:.1f}s busy, "
+            f"{self.blocked:.1f}s blocked on next stage, {utilisation:.0f}% utilised across {self.workers} workers"
+        )
+
+
+class JournalJob:
+    # pylint: disable=too-few-public-methods
+    def __init__(self, journal: tuple, source: str, destination: str):
+        self.journal_filename = f"{journal[1].decode('utf-8')}.cdb"
+        self.journal_s3_path = swap_path(self.journal_filename, source, destination)
+        self.hints_s3_path = swap_path(f"{journal[1].decode('utf-8')}.hints.cdb", source, destination)
+        self.hints: Union[bytes, str] = b""
+        self.messages: list = []
+        self.future: Future = Future()
+
+
+# Journals flow through three stages connected by bounded queues: scan (in the caller's
+# thread) decides what needs uploading, hints builds hints files in the hints executor,
+# and upload sends hints and journals to S3. While the CPU builds hints for one journal
+# the network is kept busy uploading others, and a full queue holds back the stage
+# feeding it, so only a few finished hints files are held in memory at any time.
+class BackupPipeline:
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        config: dict,
+        ledger: Union[UploadLedger, None] = None,
+        hints_executor: Union[Executor, None] = None,
+    ):
+        self.source = config["hotbackup_path"]
+        self.destination = config["s3_path"]
+        self.endpoint = config["s3_endpoint"]
+        self.hints_files = config["hints_files"]
+        self.hints_spool_max_size = config["hints_spool_max_size"]
+        self.scratch_dir = config["scratch_path"]
+        self.ledger = ledger
+        self.hints_executor = hints_executor
+        self.stopped = threading.Event()
+        self.started = time.monotonic()
+
+        hints_workers = config["hints_workers"] if self.hints_files else 0
+        self.scan_stats = StageStats("scan", 1)
+        self.hints_stats = StageStats("hints", hints_workers)
+        self.upload_stats = StageStats("upload", config["workers"])
+        self.hints_queue: queue.Queue = queue.Queue(maxsize=max(1, hints_workers))
+        self.upload_queue: queue.Queue = queue.Queue(maxsize=config["workers"])
+        self.hints_threads = [threading.Thread(target=self.hints_worker, daemon=True) for _ in range(hints_workers)]
+        self.upload_threads = [
+            threading.Thread(target=self.upload_worker, daemon=True) for _ in range(config["workers"])
+        ]
+        for thread in self.hints_threads + self.upload_threads:
+            thread.start()
+
+    def submit(self, journal: tuple, existing: Union[dict, None] = None) -> Future:
+        start = time.monotonic()
+        job = JournalJob(journal, self.source, self.destination)
+        if journal_is_uploaded(job.journal_filename, job.journal_s3_path, self.endpoint, existing, self.ledger):
+            job.messages.append(f"{job.journal_s3_path} already exists")
+            self.complete(job)
+            self.scan_stats.record(time.monotonic() - start)
+            return job.future
+
+        next_queue = self.hints_queue if self.hints_files else self.upload_queue
+        busy = time.monotonic() - start
+        next_queue.put(job)
+        self.scan_stats.record(busy, time.monotonic() - start - busy)
+        return job.future
+
+    def hints_worker(self) -> None:
+        while True:
+            job = self.hints_queue.get()
+            if job is None:
+                return
+            if self.stopped.is_set():
+                continue
+            start = time.monotonic()
+            try:
+                job.hints = build_journal_hints(
+                    job.journal_filename, self.hints_executor, self.hints_spool_max_size, self.scratch_dir
+                )
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                job.future.set_exception(err)
+                continue
+            busy = time.monotonic() - start
+            self.upload_queue.put(job)
+            self.hints_stats.record(busy, time.monotonic() - start - busy)
+
+    def upload_worker(self) -> None:
+        while True:
+            job = self.upload_queue.get()
+            if job is None:
+                return
+            if self.stopped.is_set():
+                if isinstance(job.hints, str):
+                    os.remove(job.hints)
+                continue
+            start = time.monotonic()
+            try:
+                if self.hints_files:
+                    upload_journal_hints(job.hints, job.hints_s3_path, self.endpoint, job.messages.append)
+                upload_journal_file(job.journal_filename, job.journal_s3_path, self.endpoint, job.messages.append)
+                self.complete(job)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                job.future.set_exception(err)
+            self.upload_stats.record(time.monotonic() - start)
+
+    def complete(self, job: JournalJob) -> None:
+        if self.ledger is not None:
+            self.ledger.record_upload(job.journal_filename, job.journal_s3_path)
+        job.future.set_result(job.messages)
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def close(self) -> None:
+        for _ in self.hints_threads:
+            self.hints_queue.put(None)
+        for thread in self.hints_threads:
+            thread.join()
+        for _ in self.upload_threads:
+            self.upload_queue.put(None)
+        for thread in self.upload_threads:
+            thread.join()
+
+    def report(self) -> list:
+        elapsed = time.monotonic() - self.started
+        stages = [self.scan_stats, self.hints_stats, self.upload_stats]
+        return [stage.report(elapsed) for stage in stages if stage.workers > 0]
@@ -0,0 +1,111 @@
+import datetime
+import threading
+import time
+from typing import Union
+
+
+class TokenBucket:
+    # Callers take tokens up front and sleep off any debt, so a large transfer only
+    # delays itself, and concurrent callers share the rate between them
+    def __init__(self, rate: Union[int, None] = None):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate: Union[int, None]) -> None:
+        with self.lock:
+            self.refill()
+            self.rate = rate
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        if self.rate is not None:
+            # Up to one second of unused capacity can be saved up for a burst
+            self.tokens = min(float(self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: int = 1) -> float:
+        with self.lock:
+            if self.rate is None:
+                return 0.0
+            self.refill()
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def parse_time_of_day(value: Union[str, datetime.time]) -> datetime.time:
+    if isinstance(value, datetime.time):
+        return value
+    if isinstance(value, str):
+        return datetime.datetime.strptime(value, "%H:%M").time()
+    raise ValueError(f"{value} is not a valid time of day")
+
+
+def in_window(now: datetime.time, start: datetime.time, end: datetime.time) -> bool:
+    if start <= end:
+        return start <= now < end
+    # The window runs past midnight
+    return now >= start or now < end
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        max_bandwidth: Union[int, None] = None,
+        max_requests: Union[int, None] = None,
+        schedule: Union[list, None] = None,
+    ):
+        self.bandwidth = TokenBucket()
+        self.requests = TokenBucket()
+        self.window: Union[dict, None] = None
+        self.checked = 0.0
+        self.configure(max_bandwidth, max_requests, schedule)
+
+    def configure(
+        self,
+        max_bandwidth: Union[int, None] = None,
+        max_requests: Union[int, None] = None,
+        schedule: Union[list, None] = None,
+    ) -> None:
+        self.max_bandwidth = max_bandwidth
+        self.max_requests = max_requests
+        self.schedule = schedule or []
+        self.window = None
+        self.checked = 0.0
+        self.update_limits()
+
+    def current_limits(self, now: Union[datetime.time, None] = None) -> dict:
+        if now is None:
+            now = datetime.datetime.now().time()
+        limits = {"max_bandwidth": self.max_bandwidth, "max_requests": self.max_requests}
+        for window in self.schedule:
+            if in_window(now, window["start"], window["end"]):
+                limits.update({name: window[name] for name in limits if name in window})
+                break
+        return limits
+
+    def update_limits(self) -> None:
+        # The schedule is only looked at once a second, not for every chunk
+        now = time.monotonic()
+        if self.checked and now - self.checked < 1.0:
+            return
+        self.checked = now
+        limits = self.current_limits()
+        if limits != self.window:
+            self.window = limits
+            self.bandwidth.set_rate(limits["max_bandwidth"])
+            self.requests.set_rate(limits["max_requests"])
+
+    def throttle_bytes(self, num_bytes: int) -> None:
+        # boto3 reports negative progress when a part is retried, which is not new traffic
+        if num_bytes > 0:
+            self.update_limits()
+            self.bandwidth.acquire(num_bytes)
+
+    def throttle_request(self, **_kwargs) -> None:
+        self.update_limits()
+        self.requests.acquire()
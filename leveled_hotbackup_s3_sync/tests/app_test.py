@@ -8,10 +8,16 @@ import boto3
 import pytest
 from moto import mock_s3
 
-from leveled_hotbackup_s3_sync.app import backup, main, restore
-from leveled_hotbackup_s3_sync.journal import list_keys
+from leveled_hotbackup_s3_sync.app import backup, device_read_share, main, restore
+from leveled_hotbackup_s3_sync.fileio import configure_reads
+from leveled_hotbackup_s3_sync.journal import list_existing_journals, list_keys
+from leveled_hotbackup_s3_sync.ledger import LEDGER_FILENAME
 from leveled_hotbackup_s3_sync.manifest import read_manifest
-from leveled_hotbackup_s3_sync.utils import get_owned_partitions
+from leveled_hotbackup_s3_sync.utils import (
+    adaptive_multipart_chunksize,
+    configure_s3_transfers,
+    get_owned_partitions,
+)
 
 TEST_CONFIG_FILENAME = "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59.cfg"
 TEST_CONFIG = b"""
@@ -28,7 +34,22 @@ TEST_CONFIG_DICT = {
     "leveled_path": "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59",
     "s3_path": "s3://test/hotbackup3/",
     "hints_files": False,
+    "hints_workers": 1,
+    "hints_spool_max_size": 67108864,
+    "scratch_path": None,
     "s3_endpoint": None,
+    "workers": 4,
+    "upload_ledger": False,
+    "ledger_reconcile_days": 7,
+    "multipart_chunksize": 8388608,
+    "adaptive_chunksize": False,
+    "transfer_concurrency": 10,
+    "max_inflight_bytes": None,
+    "max_bandwidth": None,
+    "max_requests": None,
+    "rate_limit_schedule": [],
+    "io_mode": "default",
+    "max_device_read_bandwidth": None,
     "tag": "123",
 }
 
@@ -62,6 +83,99 @@ def test_backup(s3_client):
         assert f"hotbackup3/{str(partition)}/journal/journal_manifest/{TEST_CONFIG_DICT['tag']}.man" in s3_keys
 
 
+def test_backup_hints_workers(s3_client):
+    config = deepcopy(TEST_CONFIG_DICT)
+    config["hints_files"] = True
+    config["hints_workers"] = 2
+    backup(config)
+    response = s3_client.list_objects_v2(Bucket="test", Prefix="hotbackup3/0/journal/journal_files/")
+    s3_keys = [x["Key"] for x in response["Contents"]]
+    assert "hotbackup3/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.hints.cdb" in s3_keys
+    assert "hotbackup3/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb" in s3_keys
+    assert not os.path.exists(
+        os.path.join(
+            config["hotbackup_path"],  # type: ignore
+            "0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.hints.cdb",
+        )
+    )
+
+
+def test_backup_nocache(s3_client):
+    config = deepcopy(TEST_CONFIG_DICT)
+    config["hints_files"] = True
+    config["hints_workers"] = 2
+    config["io_mode"] = "nocache"
+    config["max_device_read_bandwidth"] = 1 << 40
+    try:
+        backup(config)
+    finally:
+        configure_reads("default", None)
+    response = s3_client.list_objects_v2(Bucket="test", Prefix="hotbackup3/0/journal/journal_files/")
+    s3_keys = [x["Key"] for x in response["Contents"]]
+    assert "hotbackup3/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.hints.cdb" in s3_keys
+    assert "hotbackup3/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb" in s3_keys
+
+
+def test_device_read_share():
+    config = deepcopy(TEST_CONFIG_DICT)
+    assert device_read_share(config) is None
+    config["max_device_read_bandwidth"] = 3000
+    assert device_read_share(config) == 3000
+    config["hints_files"] = True
+    config["hints_workers"] = 2
+    assert device_read_share(config) == 1000
+
+
+@patch("leveled_hotbackup_s3_sync.pipeline.upload_journal_file", side_effect=ValueError("upload failed"))
+def test_backup_journal_error(patched_upload, s3_client):  # pylint: disable=unused-argument
+    with pytest.raises(ValueError) as exc:
+        backup(TEST_CONFIG_DICT)
+    assert str(exc.value) == "upload failed"
+    response = s3_client.list_objects_v2(Bucket="test", Prefix="hotbackup3/")
+    assert "Contents" not in response
+
+
+def without_throughput(output: str) -> list:
+    return [line for line in output.splitlines() if not line.startswith(("Uploaded ", "Stage "))]
+
+
+def test_backup_output_order(s3_client, capsys):  # pylint: disable=unused-argument
+    config = deepcopy(TEST_CONFIG_DICT)
+    config["workers"] = 1
+    backup(config)
+    serial_output = capsys.readouterr().out
+
+    config["s3_path"] = "s3://test/hotbackup4/"
+    config["workers"] = 16
+    backup(config)
+    parallel_output = capsys.readouterr().out
+
+    assert without_throughput(parallel_output) == without_throughput(serial_output.replace("hotbackup3", "hotbackup4"))
+
+
+def test_backup_ledger(s3_client):
+    config = deepcopy(TEST_CONFIG_DICT)
+    config["upload_ledger"] = True
+    ledger_filename = os.path.join(config["hotbackup_path"], LEDGER_FILENAME)  # type: ignore
+    try:
+        backup(config)
+        assert os.path.exists(ledger_filename)
+
+        # Once reconciled, a no-change backup trusts the ledger and never lists S3
+        config["tag"] = "456"
+        with patch(
+            "leveled_hotbackup_s3_sync.app.list_existing_journals", wraps=list_existing_journals
+        ) as patched_list:
+            backup(config)
+        patched_list.assert_not_called()
+
+        response = s3_client.list_objects_v2(Bucket="test", Prefix="hotbackup3/")
+        s3_keys = [x["Key"] for x in response["Contents"]]
+        assert "hotbackup3/0/journal/journal_manifest/456.man" in s3_keys
+    finally:
+        os.remove(ledger_filename)
+
+
 def test_restore(s3_client):  # pylint: disable=unused-argument
     config = deepcopy(TEST_CONFIG_DICT)
 
@@ -90,6 +204,27 @@ def test_restore(s3_client):  # pylint: disable=unused-argument
         assert len(journal_keys) == 485
 
 
+def test_restore_adaptive_chunksize(s3_client):  # pylint: disable=unused-argument
+    config = deepcopy(TEST_CONFIG_DICT)
+    backup(config)
+
+    config["adaptive_chunksize"] = True
+    with tempfile.TemporaryDirectory() as tmpdir, patch(
+        "leveled_hotbackup_s3_sync.utils.adaptive_multipart_chunksize", wraps=adaptive_multipart_chunksize
+    ) as patched_chunksize:
+        config["leveled_path"] = tmpdir
+        try:
+            restore(config)
+        finally:
+            configure_s3_transfers(8388608, False, 10, None)
+        journal_filename = os.path.join(tmpdir, "0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb")
+        # Every journal download was sized from the listing
+        assert patched_chunksize.call_count == len(
+            [name for _, _, files in os.walk(tmpdir) for name in files if name.endswith(".cdb")]
+        )
+        patched_chunksize.assert_any_call(os.path.getsize(journal_filename))
+
+
 @contextmanager
 def create_test_config():
     with open(TEST_CONFIG_FILENAME, "wb") as file_handle:
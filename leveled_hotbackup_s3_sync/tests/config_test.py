@@ -1,3 +1,4 @@
+import datetime
 import tempfile
 
 import pytest
@@ -5,6 +6,10 @@ import pytest
 from leveled_hotbackup_s3_sync.config import (
     check_directory,
     check_endpoint_url,
+    check_io_mode,
+    check_multipart_chunksize,
+    check_positive_int,
+    check_rate_limit_schedule,
     check_s3_url,
     read_config,
 )
@@ -33,6 +38,54 @@ def test_check_directory():
         check_directory("/random/path/shouldnt/exist")
 
 
+def test_check_positive_int():
+    assert check_positive_int(1) == 1
+    assert check_positive_int(64) == 64
+    with pytest.raises(ValueError):
+        check_positive_int(0)
+    with pytest.raises(ValueError):
+        check_positive_int(-1)
+    with pytest.raises(ValueError):
+        check_positive_int(True)
+    with pytest.raises(ValueError):
+        check_positive_int("4")  # type: ignore
+
+
+def test_check_multipart_chunksize():
+    assert check_multipart_chunksize(5242880) == 5242880
+    assert check_multipart_chunksize(536870912) == 536870912
+    with pytest.raises(ValueError):
+        check_multipart_chunksize(1024)
+    with pytest.raises(ValueError):
+        check_multipart_chunksize(536870913)
+    with pytest.raises(ValueError):
+        check_multipart_chunksize(0)
+
+
+def test_check_io_mode():
+    assert check_io_mode("default") == "default"
+    assert check_io_mode("nocache") == "nocache"
+    with pytest.raises(ValueError):
+        check_io_mode("direct")
+
+
+def test_check_rate_limit_schedule():
+    assert check_rate_limit_schedule([]) == []
+    assert check_rate_limit_schedule([{"start": "22:00", "end": datetime.time(6, 0), "max_requests": 50}]) == [
+        {"start": datetime.time(22, 0), "end": datetime.time(6, 0), "max_requests": 50}
+    ]
+    with pytest.raises(ValueError):
+        check_rate_limit_schedule({"start": "22:00", "end": "06:00"})  # type: ignore
+    with pytest.raises(ValueError):
+        check_rate_limit_schedule([{"start": "22:00"}])
+    with pytest.raises(ValueError):
+        check_rate_limit_schedule([{"start": "22:00", "end": "6pm"}])
+    with pytest.raises(ValueError):
+        check_rate_limit_schedule([{"start": "22:00", "end": "06:00", "max_bandwidth": 0}])
+    with pytest.raises(ValueError):
+        check_rate_limit_schedule([{"start": "22:00", "end": "06:00", "workers": 8}])
+
+
 def test_config_1():
     with tempfile.NamedTemporaryFile() as file_handle:
         file_handle.write(EXAMPLE_CONFIG_1)
@@ -43,7 +96,25 @@ def test_config_1():
     assert config["leveled_path"] == "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59"
     assert config["s3_path"] == "s3://test/hotbackup/"
     assert config["hints_files"]
+    assert config["hints_workers"] == 4
+    assert config["hints_spool_max_size"] == 1048576
+    assert config["scratch_path"] == "/tmp"
     assert config["s3_endpoint"] == "http://localhost:4566"
+    assert config["workers"] == 8
+    assert config["upload_ledger"] is True
+    assert config["ledger_reconcile_days"] == 30
+    assert config["multipart_chunksize"] == 67108864
+    assert config["adaptive_chunksize"] is True
+    assert config["transfer_concurrency"] == 16
+    assert config["max_inflight_bytes"] == 1073741824
+    assert config["max_bandwidth"] == 52428800
+    assert config["max_requests"] is None
+    assert config["rate_limit_schedule"] == [
+        {"start": datetime.time(22, 0), "end": datetime.time(6, 0), "max_bandwidth": 524288000},
+        {"start": datetime.time(9, 30), "end": datetime.time(17, 0), "max_requests": 100},
+    ]
+    assert config["io_mode"] == "nocache"
+    assert config["max_device_read_bandwidth"] == 104857600
     assert config["tag"] == "123"
 
 
@@ -57,7 +128,22 @@ def test_config_2():
     assert config["leveled_path"] == "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59"
     assert config["s3_path"] == "s3://test2/hotbackup/"
     assert config["hints_files"] is False
+    assert config["hints_workers"] == 1
+    assert config["hints_spool_max_size"] == 67108864
+    assert config["scratch_path"] is None
     assert config["s3_endpoint"] is None
+    assert config["workers"] == 4
+    assert config["upload_ledger"] is False
+    assert config["ledger_reconcile_days"] == 7
+    assert config["multipart_chunksize"] == 8388608
+    assert config["adaptive_chunksize"] is False
+    assert config["transfer_concurrency"] == 10
+    assert config["max_inflight_bytes"] is None
+    assert config["max_bandwidth"] is None
+    assert config["max_requests"] is None
+    assert config["rate_limit_schedule"] == []
+    assert config["io_mode"] == "default"
+    assert config["max_device_read_bandwidth"] is None
     assert config["tag"] == "123"
 
 
@@ -85,7 +171,24 @@ ring_path = "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59-ring"
 leveled_path = "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59"
 s3_path = "s3://test/hotbackup/"
 hints_files = true
+hints_workers = 4
+hints_spool_max_size = 1048576
+scratch_path = "/tmp"
 s3_endpoint = "http://localhost:4566"
+workers = 8
+upload_ledger = true
+ledger_reconcile_days = 30
+multipart_chunksize = 67108864
+adaptive_chunksize = true
+transfer_concurrency = 16
+max_inflight_bytes = 1073741824
+max_bandwidth = 52428800
+rate_limit_schedule = [
+    { start = "22:00", end = "06:00", max_bandwidth = 524288000 },
+    { start = 09:30:00, end = 17:00:00, max_requests = 100 },
+]
+io_mode = "nocache"
+max_device_read_bandwidth = 104857600
 """
 
 EXAMPLE_CONFIG_2 = b"""
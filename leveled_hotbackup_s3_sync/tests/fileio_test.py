@@ -0,0 +1,100 @@
+import os
+import tempfile
+from unittest.mock import call, patch
+
+import pytest
+
+from leveled_hotbackup_s3_sync.fileio import (
+    DROP_BEHIND_SIZE,
+    PAGE_SIZE,
+    BackupReader,
+    advise,
+    configure_reads,
+    get_device_bucket,
+    managed_reads,
+    resident_pages,
+)
+
+
+def test_configure_reads():
+    try:
+        assert managed_reads() is False
+        configure_reads("nocache", None)
+        assert managed_reads() is True
+        configure_reads("default", 1000)
+        assert managed_reads() is True
+        assert get_device_bucket(1) is get_device_bucket(1)
+        assert get_device_bucket(1) is not get_device_bucket(2)
+        assert get_device_bucket(1).rate == 1000
+    finally:
+        configure_reads("default", None)
+    assert managed_reads() is False
+    assert get_device_bucket(1).rate is None
+
+
+def test_backup_reader():
+    data = os.urandom(3 * DROP_BEHIND_SIZE)
+    with tempfile.NamedTemporaryFile() as file_handle:
+        file_handle.write(data)
+        file_handle.flush()
+
+        with BackupReader(file_handle.name) as reader:
+            assert reader.read() == data
+
+        configure_reads("nocache", 1 << 40)
+        try:
+            bucket = get_device_bucket(os.stat(file_handle.name).st_dev)
+            # Pages 10 to 19 were already in the page cache
+            cached = range(10, 20)
+            with patch("leveled_hotbackup_s3_sync.fileio.advise") as mock_advise, patch.object(
+                bucket, "acquire"
+            ) as mock_acquire, patch(
+                "leveled_hotbackup_s3_sync.fileio.resident_pages",
+                side_effect=lambda _, first, num: bytes(int(page in cached) for page in range(first, first + num)),
+            ):
+                with BackupReader(file_handle.name) as reader:
+                    fileno = reader.fileno()
+                    assert reader.read(DROP_BEHIND_SIZE // 2) == data[: DROP_BEHIND_SIZE // 2]
+                    buffer = bytearray(DROP_BEHIND_SIZE)
+                    assert reader.readinto(buffer) == DROP_BEHIND_SIZE
+                    assert buffer == data[DROP_BEHIND_SIZE // 2 : 3 * DROP_BEHIND_SIZE // 2]
+                    assert reader.read() == data[3 * DROP_BEHIND_SIZE // 2 :]
+                assert mock_advise.call_args_list == [
+                    call(fileno, 0, 0, "POSIX_FADV_SEQUENTIAL"),
+                    call(fileno, 0, 10 * PAGE_SIZE, "POSIX_FADV_DONTNEED"),
+                    call(fileno, 20 * PAGE_SIZE, 3 * DROP_BEHIND_SIZE // 2 - 20 * PAGE_SIZE, "POSIX_FADV_DONTNEED"),
+                    call(fileno, 3 * DROP_BEHIND_SIZE // 2, 3 * DROP_BEHIND_SIZE // 2, "POSIX_FADV_DONTNEED"),
+                ]
+                assert sum(args[0] for args, _ in mock_acquire.call_args_list) == len(data)
+        finally:
+            configure_reads("default", None)
+
+
+def test_backup_reader_keeps_cached_pages():
+    data = os.urandom(2 * DROP_BEHIND_SIZE)
+    num_pages = len(data) // PAGE_SIZE
+    with tempfile.NamedTemporaryFile() as file_handle:
+        file_handle.write(data)
+        file_handle.flush()
+        os.fsync(file_handle.fileno())
+        fileno = file_handle.fileno()
+        advise(fileno, 0, 0, "POSIX_FADV_DONTNEED")
+        pages = resident_pages(fileno, 0, num_pages)
+        if pages is None or any(page & 1 for page in pages):
+            pytest.skip("page cache residency cannot be controlled here")
+
+        # The live node has the first half of the file cached
+        with open(file_handle.name, "rb") as live_handle:
+            live_handle.read(len(data) // 2)
+
+        configure_reads("nocache", None)
+        try:
+            with BackupReader(file_handle.name) as reader:
+                assert reader.read() == data
+        finally:
+            configure_reads("default", None)
+
+        pages = resident_pages(fileno, 0, num_pages)
+        assert pages is not None
+        assert all(page & 1 for page in pages[: num_pages // 2])
+        assert not any(page & 1 for page in pages[num_pages // 2 :])
@@ -1,10 +1,23 @@
+import os
 import tempfile
 
 import cdblib
+import pytest
 
-from leveled_hotbackup_s3_sync.erlang import OtpErlangBinary, term_to_binary
-from leveled_hotbackup_s3_sync.hints import create_hints_file, get_sqn
-from leveled_hotbackup_s3_sync.journal import list_keys
+from leveled_hotbackup_s3_sync.erlang import (
+    OtpErlangAtom,
+    OtpErlangBinary,
+    term_to_binary,
+)
+from leveled_hotbackup_s3_sync.hints import (
+    SpooledHintsFile,
+    build_hints,
+    create_hints_file,
+    get_sqn,
+    hints_entry,
+    slice_hints_entry,
+)
+from leveled_hotbackup_s3_sync.journal import iter_keys, list_keys
 
 
 def test_create_hints_file():
@@ -61,3 +74,80 @@ def test_e2e_hints_files():
             assert get_sqn(reader, b"testBucket", b"testKey75") == 976
             assert get_sqn(reader, b"testBucket", b"testKey9120") == 1382
             assert get_sqn(reader, b"typedBucket", b"typedKey52", b"testType") == 1419
+
+
+def test_create_hints_file_streamed():
+    journal_filename = (
+        "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb"
+    )
+    with tempfile.NamedTemporaryFile() as decoded_handle, tempfile.NamedTemporaryFile() as streamed_handle:
+        create_hints_file(decoded_handle.name, list_keys(journal_filename))
+        create_hints_file(streamed_handle.name, iter_keys(journal_filename, decode=False))
+        assert decoded_handle.read() == streamed_handle.read()
+
+
+def test_hints_entry():
+    for sqn in [0, 255, 256, 2147483647, 2147483648]:
+        for bucket in [OtpErlangBinary(b"testBucket"), (OtpErlangBinary(b"testType"), OtpErlangBinary(b"typedBucket"))]:
+            journal_key = (
+                sqn,
+                OtpErlangAtom(b"stnd"),
+                (OtpErlangAtom(b"o_rkv"), bucket, OtpErlangBinary(b"testKey"), OtpErlangAtom(b"null")),
+            )
+            expected = (sqn, term_to_binary((bucket, OtpErlangBinary(b"testKey"))))
+            assert hints_entry(journal_key) == expected
+            assert hints_entry(term_to_binary(journal_key)) == expected
+            assert slice_hints_entry(term_to_binary(journal_key)) == expected
+
+    # Keys which cannot be sliced are fully decoded instead
+    plain_key = (1, OtpErlangAtom(b"stnd"), (OtpErlangAtom(b"o_rkv"), b"bucket", b"key", OtpErlangAtom(b"null")))
+    with pytest.raises(ValueError):
+        slice_hints_entry(term_to_binary(plain_key))
+    assert hints_entry(term_to_binary(plain_key)) == (1, term_to_binary((b"bucket", b"key")))
+
+
+def test_build_hints():
+    journal_filename = (
+        "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb"
+    )
+    with tempfile.NamedTemporaryFile() as file_handle:
+        create_hints_file(file_handle.name, iter_keys(journal_filename, decode=False))
+        expected = file_handle.read()
+
+    assert build_hints(iter_keys(journal_filename, decode=False)) == expected
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        spilled = build_hints(iter_keys(journal_filename, decode=False), 1024, scratch_dir)
+        assert isinstance(spilled, str)
+        assert os.path.dirname(spilled) == scratch_dir
+        with open(spilled, "rb") as file_handle:
+            assert file_handle.read() == expected
+
+
+def test_spooled_hints_file():
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        spool = SpooledHintsFile(8, scratch_dir)
+        spool.write(b"1234")
+        spool.write(b"5678")
+        assert spool.filename is None
+        spool.seek(0)
+        spool.write(b"ab")
+        assert spool.result() == b"ab345678"
+
+        spool = SpooledHintsFile(8, scratch_dir)
+        spool.write(b"12345")
+        spool.write(b"6789")
+        assert spool.filename is not None
+        assert spool.tell() == 9
+        spool.seek(0)
+        spool.write(b"ab")
+        filename = spool.result()
+        with open(filename, "rb") as file_handle:
+            assert file_handle.read() == b"ab3456789"
+
+        os.remove(filename)
+
+        spool = SpooledHintsFile(1, scratch_dir)
+        spool.write(b"12")
+        spool.discard()
+        assert not os.listdir(scratch_dir)
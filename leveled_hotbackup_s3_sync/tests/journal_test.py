@@ -1,17 +1,30 @@
+import os
 import os.path
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
 
 import boto3
+import cdblib
 import pytest
 from moto import mock_s3
 
 from leveled_hotbackup_s3_sync import erlang
+from leveled_hotbackup_s3_sync.fileio import configure_reads
 from leveled_hotbackup_s3_sync.journal import (
     decode_journal_object,
+    list_existing_journals,
     list_keys,
     maybe_download_journal,
     maybe_upload_journal,
+    stream_keys,
     update_journal_filename,
+    upload_journal_file,
+)
+from leveled_hotbackup_s3_sync.utils import (
+    MIB,
+    adaptive_multipart_chunksize,
+    configure_s3_transfers,
 )
 
 HOTBACKUP_DIR = "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59"
@@ -52,6 +65,54 @@ def test_list_keys():
     )
 
 
+def test_list_keys_streamed():
+    filename = f"{HOTBACKUP_DIR}/0/journal/journal_files/0_50f4666b-6ad8-4b6f-9e2a-23a235c82706.cdb"
+    expected = list_keys(filename)
+    configure_reads("nocache", 1 << 30)
+    try:
+        assert list_keys(filename) == expected
+    finally:
+        configure_reads("default", None)
+
+
+def test_stream_keys():
+    keys = [f"key{idx}".encode("utf-8") for idx in range(1000)]
+    with tempfile.NamedTemporaryFile() as file_handle:
+        with cdblib.Writer(file_handle) as writer:
+            for idx, key in enumerate(keys):
+                # Values larger than the read buffer are skipped over
+                writer.put(key, os.urandom(2 * 1024 * 1024 if idx % 100 == 0 else idx))
+        file_handle.flush()
+        assert list(stream_keys(file_handle.name)) == keys
+        with cdblib.Reader.from_file_path(file_handle.name) as reader:
+            assert list(reader.iterkeys()) == keys
+
+    with tempfile.NamedTemporaryFile() as file_handle:
+        with cdblib.Writer(file_handle):
+            pass
+        file_handle.flush()
+        assert not list(stream_keys(file_handle.name))
+
+    with tempfile.NamedTemporaryFile() as file_handle:
+        file_handle.write(b"not a cdb")
+        file_handle.flush()
+        with pytest.raises(ValueError):
+            list(stream_keys(file_handle.name))
+
+
+def test_upload_journal_file_nocache(s3_client):
+    data = os.urandom(1024 * 1024)
+    configure_reads("nocache", 1 << 30)
+    try:
+        with tempfile.NamedTemporaryFile() as file_handle:
+            file_handle.write(data)
+            file_handle.flush()
+            upload_journal_file(file_handle.name, "s3://test/nocache/1_journal.cdb", None)
+    finally:
+        configure_reads("default", None)
+    assert s3_client.get_object(Bucket="test", Key="nocache/1_journal.cdb")["Body"].read() == data
+
+
 def test_decode_journal_object():
     test_key = (
         b"\x83h\x03b\x00\x00\x01\xfad\x00\x04stndh\x04d\x00\x05o_rkvm\x00\x00\x00\ntestBucketm\x00\x00\x00\ntestKey"
@@ -157,6 +218,66 @@ def test_maybe_upload_journal(s3_client):
     assert s3_head["ResponseMetadata"]["HTTPStatusCode"] == 200
 
 
+def test_maybe_upload_journal_hints_executor(s3_client):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(f"{tmpdir}/972_journal.cdb", "wb") as file_handle:
+            with open(
+                f"{HOTBACKUP_DIR}/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb", "rb"
+            ) as reader:
+                file_handle.write(reader.read())
+        with ProcessPoolExecutor(max_workers=1) as hints_executor:
+            maybe_upload_journal(
+                (972, f"{tmpdir}/972_journal".encode("utf-8")),
+                tmpdir,
+                "s3://test/hints_executor",
+                True,
+                None,
+                hints_executor=hints_executor,
+            )
+        assert not os.path.exists(f"{tmpdir}/972_journal.hints.cdb")
+
+    s3_head = s3_client.head_object(Bucket="test", Key="hints_executor/972_journal.hints.cdb")
+    assert s3_head["ResponseMetadata"]["HTTPStatusCode"] == 200
+
+
+def test_maybe_upload_journal_existing(s3_client, capsys):
+    journal = (
+        972,
+        b"/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a",
+    )
+    s3_path = "s3://test/existing/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb"
+    journal_size = os.path.getsize(f"{journal[1].decode('utf-8')}.cdb")
+
+    # A listed object of the same size is trusted without any S3 request
+    maybe_upload_journal(
+        journal, f"{HOTBACKUP_DIR}/", "s3://test/existing/", False, None, {s3_path: {"size": journal_size}}
+    )
+    assert capsys.readouterr().out == f"{s3_path} already exists\n"
+    assert "Contents" not in s3_client.list_objects_v2(Bucket="test", Prefix="existing/")
+
+    # A size mismatch means the listed object is not this journal
+    maybe_upload_journal(journal, f"{HOTBACKUP_DIR}/", "s3://test/existing/", False, None, {s3_path: {"size": 1}})
+    assert capsys.readouterr().out.startswith("Uploading ")
+    assert s3_client.head_object(Bucket="test", Key=s3_path[10:])["ContentLength"] == journal_size
+
+
+def test_list_existing_journals(s3_client):
+    manifest = [
+        (972, f"{HOTBACKUP_DIR}/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a".encode("utf-8")),
+        (486, f"{HOTBACKUP_DIR}/0/journal/journal_files/486_71e4b785-9c5d-4f3a-bb4a-d2e3fdc66945".encode("utf-8")),
+    ]
+    s3_client.put_object(
+        Bucket="test", Key="listing/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb", Body=b"x"
+    )
+    s3_client.put_object(Bucket="test", Key="listing/1/journal/journal_files/1_abc.cdb", Body=b"x")
+
+    existing = list_existing_journals(manifest, HOTBACKUP_DIR, "s3://test/listing", None)
+    assert list(existing.keys()) == [
+        "s3://test/listing/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb"
+    ]
+    assert not list_existing_journals([], HOTBACKUP_DIR, "s3://test/listing", None)
+
+
 def test_maybe_download_journal(s3_client):
     s3_client.put_object(Bucket="test", Key="maybe_download_journal/test.cdb", Body=b"testbody")
 
@@ -178,6 +299,24 @@ def test_maybe_download_journal(s3_client):
             assert file_handle.read() == b"newbody"
 
 
+def test_maybe_download_journal_adaptive_chunksize(s3_client):
+    s3_client.put_object(Bucket="test", Key="adaptive/test.cdb", Body=b"testbody")
+    existing = list_existing_journals(
+        [(0, b"s3://test/adaptive/test")], "s3://test/adaptive", "s3://test/adaptive", None
+    )
+    configure_s3_transfers(8 * MIB, True, 10, None)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir, patch(
+            "leveled_hotbackup_s3_sync.utils.adaptive_multipart_chunksize", wraps=adaptive_multipart_chunksize
+        ) as patched_chunksize:
+            maybe_download_journal((0, b"s3://test/adaptive/test"), "s3://test/adaptive", tmpdir, None, existing)
+            with open(f"{tmpdir}/test.cdb", "rb") as file_handle:
+                assert file_handle.read() == b"testbody"
+            patched_chunksize.assert_called_once_with(8)
+    finally:
+        configure_s3_transfers(8 * MIB, False, 10, None)
+
+
 def test_update_journal_filename():
     journal = (
         972,
@@ -0,0 +1,47 @@
+import os
+import os.path
+import tempfile
+import time
+from unittest.mock import patch
+
+from leveled_hotbackup_s3_sync.ledger import SECONDS_PER_DAY, UploadLedger
+
+
+def test_upload_ledger():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ledger_filename = os.path.join(tmpdir, "ledger.db")
+        journal_filename = os.path.join(tmpdir, "1_journal.cdb")
+        with open(journal_filename, "wb") as file_handle:
+            file_handle.write(b"journal")
+
+        with UploadLedger(ledger_filename, 7) as ledger:
+            # A new ledger has never been reconciled, so nothing is trusted yet
+            assert ledger.reconciling is True
+            ledger.record_upload(journal_filename, "s3://test/1_journal.cdb")
+            assert ledger.is_uploaded(journal_filename, "s3://test/1_journal.cdb") is False
+            ledger.mark_reconciled()
+            assert ledger.reconciling is False
+            assert ledger.is_uploaded(journal_filename, "s3://test/1_journal.cdb") is True
+            assert ledger.is_uploaded(journal_filename, "s3://other/1_journal.cdb") is False
+
+        with UploadLedger(ledger_filename, 7) as ledger:
+            assert ledger.reconciling is False
+            assert ledger.is_uploaded(journal_filename, "s3://test/1_journal.cdb") is True
+
+            os.utime(journal_filename, ns=(0, 0))
+            assert ledger.is_uploaded(journal_filename, "s3://test/1_journal.cdb") is False
+
+
+def test_upload_ledger_reconcile_days():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ledger_filename = os.path.join(tmpdir, "ledger.db")
+        with UploadLedger(ledger_filename, 7) as ledger:
+            ledger.mark_reconciled()
+
+        with patch("leveled_hotbackup_s3_sync.ledger.time.time", return_value=time.time() + 6 * SECONDS_PER_DAY):
+            with UploadLedger(ledger_filename, 7) as ledger:
+                assert ledger.reconciling is False
+
+        with patch("leveled_hotbackup_s3_sync.ledger.time.time", return_value=time.time() + 8 * SECONDS_PER_DAY):
+            with UploadLedger(ledger_filename, 7) as ledger:
+                assert ledger.reconciling is True
@@ -0,0 +1,125 @@
+import os.path
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from leveled_hotbackup_s3_sync.pipeline import BackupPipeline, StageStats
+
+HOTBACKUP_DIR = "/tmp/a5017381-4c3e-46e6-bd02-342c4b894b59"
+JOURNAL_FILENAME = f"{HOTBACKUP_DIR}/0/journal/journal_files/972_e6205c6c-3b8b-40e6-baee-295dcc76488a.cdb"
+
+
+@pytest.fixture(name="s3_client")
+def fixture_s3_client():
+    with mock_s3():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket="test")
+        yield s3_client
+
+
+@pytest.fixture(name="journal_dir")
+def fixture_journal_dir():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for idx in range(4):
+            shutil.copyfile(JOURNAL_FILENAME, os.path.join(tmpdir, f"{idx}_journal.cdb"))
+        yield tmpdir
+
+
+def pipeline_config(journal_dir: str, hints_files: bool) -> dict:
+    return {
+        "hotbackup_path": journal_dir,
+        "s3_path": "s3://test/pipeline/",
+        "s3_endpoint": None,
+        "hints_files": hints_files,
+        "hints_workers": 2,
+        "hints_spool_max_size": 67108864,
+        "scratch_path": None,
+        "workers": 2,
+    }
+
+
+def test_stage_stats():
+    stats = StageStats("upload", 2)
+    stats.record(3.0)
+    stats.record(1.0, 0.5)
+    assert (
+        stats.report(4.0)
+        == "Stage upload: 2 journals, 4.0s busy, 0.5s blocked on next stage, 50% utilised across 2 workers"
+    )
+    assert StageStats("scan", 1).report(0.0).endswith("0% utilised across 1 workers")
+
+
+def test_backup_pipeline(s3_client, journal_dir):
+    pipeline = BackupPipeline(pipeline_config(journal_dir, True))
+    try:
+        futures = [
+            pipeline.submit((0, os.path.join(journal_dir, f"{idx}_journal").encode("utf-8")), {}) for idx in range(4)
+        ]
+        results = [future.result() for future in futures]
+    finally:
+        pipeline.close()
+
+    assert len(os.listdir(journal_dir)) == 4
+    for idx, messages in enumerate(results):
+        assert messages[0] == f"Uploading hints from memory to s3://test/pipeline/{idx}_journal.hints.cdb"
+        assert messages[-2] == f"Uploading {journal_dir}/{idx}_journal.cdb to s3://test/pipeline/{idx}_journal.cdb"
+
+    response = s3_client.list_objects_v2(Bucket="test", Prefix="pipeline/")
+    assert len(response["Contents"]) == 8
+
+    report = pipeline.report()
+    assert len(report) == 3
+    assert report[0].startswith("Stage scan: 4 journals")
+    assert report[1].startswith("Stage hints: 4 journals")
+    assert report[2].startswith("Stage upload: 4 journals")
+
+    # Everything now exists in S3, so nothing passes the scan stage
+    existing = {
+        f"s3://test/pipeline/{idx}_journal.cdb": {"size": os.path.getsize(JOURNAL_FILENAME)} for idx in range(4)
+    }
+    pipeline = BackupPipeline(pipeline_config(journal_dir, False))
+    try:
+        future = pipeline.submit((0, os.path.join(journal_dir, "0_journal").encode("utf-8")), existing)
+        assert future.result() == ["s3://test/pipeline/0_journal.cdb already exists"]
+    finally:
+        pipeline.close()
+    assert len(pipeline.report()) == 2
+
+
+def test_backup_pipeline_scratch(s3_client, journal_dir):
+    config = pipeline_config(journal_dir, True)
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        config["hints_spool_max_size"] = 1024
+        config["scratch_path"] = scratch_dir
+        pipeline = BackupPipeline(config)
+        try:
+            messages = pipeline.submit((0, os.path.join(journal_dir, "0_journal").encode("utf-8")), {}).result()
+        finally:
+            pipeline.close()
+
+        assert messages[0].startswith(f"Uploading {scratch_dir}/")
+        assert messages[0].endswith(".hints.cdb to s3://test/pipeline/0_journal.hints.cdb")
+        assert messages[1].startswith(f"Deleting scratch copy of {scratch_dir}/")
+        assert not os.listdir(scratch_dir)
+    # Nothing is ever written next to the journals
+    assert len(os.listdir(journal_dir)) == 4
+
+    s3_head = s3_client.head_object(Bucket="test", Key="pipeline/0_journal.hints.cdb")
+    assert s3_head["ContentLength"] > 1024
+
+
+@patch("leveled_hotbackup_s3_sync.pipeline.upload_journal_file", side_effect=ValueError("upload failed"))
+def test_backup_pipeline_error(patched_upload, s3_client, journal_dir):  # pylint: disable=unused-argument
+    pipeline = BackupPipeline(pipeline_config(journal_dir, True))
+    try:
+        future = pipeline.submit((0, os.path.join(journal_dir, "0_journal").encode("utf-8")), {})
+        with pytest.raises(ValueError) as exc:
+            future.result()
+        assert str(exc.value) == "upload failed"
+    finally:
+        pipeline.stop()
+        pipeline.close()
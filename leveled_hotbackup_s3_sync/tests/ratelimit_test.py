@@ -0,0 +1,76 @@
+import datetime
+from unittest.mock import patch
+
+from leveled_hotbackup_s3_sync.ratelimit import (
+    RateLimiter,
+    TokenBucket,
+    in_window,
+    parse_time_of_day,
+)
+
+
+def test_token_bucket():
+    with patch("leveled_hotbackup_s3_sync.ratelimit.time") as mock_time:
+        mock_time.monotonic.return_value = 100.0
+        bucket = TokenBucket(1000)
+        # Starts empty, so the first caller waits for its share
+        assert bucket.acquire(500) == 0.5
+        # Debt carries over to the next caller
+        assert bucket.acquire(1000) == 1.5
+
+        mock_time.monotonic.return_value = 110.0
+        # Idle time only saves up a second's worth
+        assert bucket.acquire(1000) == 0.0
+        assert bucket.acquire(500) == 0.5
+        assert mock_time.sleep.call_count == 3
+
+
+def test_token_bucket_unlimited():
+    bucket = TokenBucket()
+    assert bucket.acquire(1 << 40) == 0.0
+    bucket.set_rate(10)
+    assert bucket.rate == 10
+    bucket.set_rate(None)
+    assert bucket.acquire(1 << 40) == 0.0
+
+
+def test_in_window():
+    assert in_window(datetime.time(12, 0), datetime.time(9, 0), datetime.time(17, 0))
+    assert not in_window(datetime.time(17, 0), datetime.time(9, 0), datetime.time(17, 0))
+    assert in_window(datetime.time(23, 0), datetime.time(22, 0), datetime.time(6, 0))
+    assert in_window(datetime.time(5, 59), datetime.time(22, 0), datetime.time(6, 0))
+    assert not in_window(datetime.time(12, 0), datetime.time(22, 0), datetime.time(6, 0))
+
+
+def test_parse_time_of_day():
+    assert parse_time_of_day("22:30") == datetime.time(22, 30)
+    assert parse_time_of_day(datetime.time(6, 0)) == datetime.time(6, 0)
+
+
+def test_rate_limiter_schedule():
+    schedule = [
+        {"start": datetime.time(22, 0), "end": datetime.time(6, 0), "max_bandwidth": 500},
+        {"start": datetime.time(9, 0), "end": datetime.time(17, 0), "max_requests": 5},
+    ]
+    limiter = RateLimiter(100, 10, schedule)
+    assert limiter.current_limits(datetime.time(23, 0)) == {"max_bandwidth": 500, "max_requests": 10}
+    assert limiter.current_limits(datetime.time(12, 0)) == {"max_bandwidth": 100, "max_requests": 5}
+    assert limiter.current_limits(datetime.time(18, 0)) == {"max_bandwidth": 100, "max_requests": 10}
+
+
+def test_rate_limiter_throttle():
+    limiter = RateLimiter(1000, 10)
+    assert limiter.bandwidth.rate == 1000
+    assert limiter.requests.rate == 10
+    with patch.object(limiter.bandwidth, "acquire") as mock_acquire:
+        limiter.throttle_bytes(100)
+        # Retried parts report negative progress
+        limiter.throttle_bytes(-100)
+        mock_acquire.assert_called_once_with(100)
+    with patch.object(limiter.requests, "acquire") as mock_acquire:
+        limiter.throttle_request(request=None)
+        mock_acquire.assert_called_once_with()
+
+    limiter.configure(None, None)
+    assert limiter.bandwidth.rate is None
+    assert limiter.requests.rate is None
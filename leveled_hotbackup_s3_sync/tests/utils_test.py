@@ -1,5 +1,7 @@
+import os
 import os.path
 import tempfile
+from unittest.mock import Mock, patch
 
 import boto3
 import botocore
@@ -9,18 +11,28 @@ from moto import mock_s3
 
 from leveled_hotbackup_s3_sync import erlang
 from leveled_hotbackup_s3_sync.utils import (
+    MIB,
+    RATE_LIMITER,
     RiakObject,
+    adaptive_multipart_chunksize,
     check_endpoint_url,
     check_s3_url,
+    configure_rate_limits,
+    configure_s3_clients,
+    configure_s3_transfers,
     create_journal_key,
     download_bytes_from_s3,
     download_file_from_s3,
     find_latest_ring,
     find_primary_partition,
+    format_throughput,
     get_owned_partitions,
     get_ring_size,
+    get_s3_client,
+    get_transfer_config,
     hash_bucket_key,
     is_s3_url,
+    list_s3_objects,
     local_path_exists,
     parse_s3_url,
     riak_ring_increment,
@@ -78,6 +90,79 @@ def test_check_endpoint_url():
         check_endpoint_url("http://localhost/path")
 
 
+def test_get_s3_client(s3_client):  # pylint: disable=unused-argument
+    configure_s3_clients(10)
+    client1 = get_s3_client(None)
+    assert get_s3_client(None) is client1
+    assert get_s3_client("http://localhost:4566") is not client1
+    assert client1.meta.config.max_pool_connections == 10
+
+    configure_s3_clients(40)
+    client2 = get_s3_client(None)
+    assert client2 is not client1
+    assert client2.meta.config.max_pool_connections == 40
+
+    configure_s3_clients(40)
+    assert get_s3_client(None) is client2
+
+
+def test_adaptive_multipart_chunksize():
+    assert adaptive_multipart_chunksize(0) == 8 * MIB
+    assert adaptive_multipart_chunksize(100 * MIB) == 8 * MIB
+    assert adaptive_multipart_chunksize(1024 * MIB) == 16 * MIB
+    assert adaptive_multipart_chunksize(4096 * MIB) == 64 * MIB
+    assert adaptive_multipart_chunksize(4096 * MIB + 1) == 65 * MIB
+    assert adaptive_multipart_chunksize(1024 * 1024 * MIB) == 512 * MIB
+
+
+def test_get_transfer_config():
+    try:
+        configure_s3_transfers(16 * MIB, False, 4, None)
+        transfer_config = get_transfer_config(4096 * MIB)
+        assert transfer_config.multipart_chunksize == 16 * MIB
+        assert transfer_config.multipart_threshold == 16 * MIB
+        assert transfer_config.max_concurrency == 4
+        assert transfer_config.max_in_memory_upload_chunks == 10
+
+        configure_s3_transfers(16 * MIB, True, 4, 256 * MIB)
+        transfer_config = get_transfer_config(4096 * MIB)
+        assert transfer_config.multipart_chunksize == 64 * MIB
+        assert transfer_config.max_concurrency == 4
+        assert transfer_config.max_in_memory_upload_chunks == 4
+        assert transfer_config.max_in_memory_download_chunks == 256 * MIB // transfer_config.io_chunksize
+
+        # Without a known size adaptive mode falls back to the configured chunk size
+        assert get_transfer_config().multipart_chunksize == 16 * MIB
+
+        # The in-flight cap also limits how many parts are transferred at once
+        configure_s3_transfers(16 * MIB, False, 10, 48 * MIB)
+        assert get_transfer_config(4096 * MIB).max_concurrency == 3
+        configure_s3_transfers(16 * MIB, False, 10, MIB)
+        assert get_transfer_config(4096 * MIB).max_concurrency == 1
+    finally:
+        configure_s3_transfers(8 * MIB, False, 10, None)
+
+
+def test_upload_file_max_inflight_bytes(s3_client):
+    s3_client.upload_file = Mock(wraps=s3_client.upload_file)
+    try:
+        configure_s3_transfers(5 * MIB, False, 10, 10 * MIB)
+        with tempfile.NamedTemporaryFile() as file_handle:
+            file_handle.write(os.urandom(12 * MIB))
+            file_handle.flush()
+            with patch("leveled_hotbackup_s3_sync.utils.get_s3_client", return_value=s3_client):
+                upload_file_to_s3(file_handle.name, "s3://test/inflight", None)
+    finally:
+        configure_s3_transfers(8 * MIB, False, 10, None)
+    assert s3_client.upload_file.call_args.kwargs["Config"].max_concurrency == 2
+    assert s3_client.head_object(Bucket="test", Key="inflight")["ContentLength"] == 12 * MIB
+
+
+def test_format_throughput():
+    assert format_throughput(100 * MIB, 2.0) == "100.0 MiB in 2.0s, 50.0 MiB/s"
+    assert format_throughput(0, 0.0) == "0.0 MiB in 0.0s, 0.0 MiB/s"
+
+
 def test_s3_path_exists(s3_client):
     s3_client.put_object(Bucket="test", Key="testkey", Body=b"test")
     s3_client.put_object(Bucket="test", Key="path/to/testkey", Body=b"test")
@@ -91,6 +176,26 @@ def test_s3_path_exists(s3_client):
     assert err["Message"] == "The specified bucket does not exist"
 
 
+def test_list_s3_objects(s3_client):
+    s3_client.put_object(Bucket="test", Key="list/a.cdb", Body=b"a")
+    s3_client.put_object(Bucket="test", Key="list/b.cdb", Body=b"bb")
+    s3_client.put_object(Bucket="test", Key="other/c.cdb", Body=b"ccc")
+
+    objects = list_s3_objects("s3://test/list/", None)
+    assert sorted(objects.keys()) == ["s3://test/list/a.cdb", "s3://test/list/b.cdb"]
+    assert objects["s3://test/list/a.cdb"]["size"] == 1
+    assert objects["s3://test/list/b.cdb"]["size"] == 2
+    assert objects["s3://test/list/b.cdb"]["etag"] == "21ad0bd836b90d08f4cf640b4c298e7c"
+
+    assert not list_s3_objects("s3://test/empty/", None)
+
+
+def test_list_s3_objects_paginated(s3_client):
+    for idx in range(1005):
+        s3_client.put_object(Bucket="test", Key=f"paginated/{idx}", Body=b"")
+    assert len(list_s3_objects("s3://test/paginated/", None)) == 1005
+
+
 def test_upload_file_to_s3(s3_client):
     with tempfile.NamedTemporaryFile() as file_handle:
         file_handle.write(b"Hello world!")
@@ -101,6 +206,24 @@ def test_upload_file_to_s3(s3_client):
     assert s3_obj["Body"].read() == b"Hello world!"
 
 
+def test_rate_limits(s3_client):
+    configure_rate_limits(1 << 30, 1000)
+    try:
+        with patch.object(RATE_LIMITER.bandwidth, "acquire") as mock_bytes, patch.object(
+            RATE_LIMITER.requests, "acquire"
+        ) as mock_requests:
+            with tempfile.NamedTemporaryFile() as file_handle:
+                file_handle.write(b"Hello world!")
+                file_handle.flush()
+                upload_file_to_s3(file_handle.name, "s3://test/limited", None)
+                download_file_from_s3("s3://test/limited", file_handle.name, None)
+            assert sum(call.args[0] for call in mock_bytes.call_args_list) == 24
+            assert mock_requests.call_count >= 2
+    finally:
+        configure_rate_limits(None, None)
+    assert s3_client.get_object(Bucket="test", Key="limited")["Body"].read() == b"Hello world!"
+
+
 def test_upload_bytes_to_s3(s3_client):
     upload_bytes_to_s3(b"Hello world!", "s3://test/world", None)
     s3_obj = s3_client.get_object(Bucket="test", Key="world")
@@ -1,16 +1,45 @@
 import hashlib
 import os
 import os.path
-from typing import Tuple, Union
+import threading
+import time
+from typing import BinaryIO, Tuple, Union
 from urllib.parse import urlparse
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.errorfactory import ClientError
 
 from leveled_hotbackup_s3_sync import erlang
+from leveled_hotbackup_s3_sync.ratelimit import RateLimiter
 
 MAX_SHA_INT = 1461501637330902918203684832716283019655932542975
 
+MIB = 1024 * 1024
+
+# boto3's managed transfers use 8 MiB parts and up to 10 threads per file by default
+TRANSFER_CONCURRENCY = 10
+MULTIPART_CHUNKSIZE = 8 * MIB
+
+# Adaptive part sizes aim for this many parts per file, within S3's limits
+ADAPTIVE_TARGET_PARTS = 64
+MIN_MULTIPART_CHUNKSIZE = 5 * MIB
+MAX_MULTIPART_CHUNKSIZE = 512 * MIB
+
+S3_CLIENT_SETTINGS = {"max_pool_connections": TRANSFER_CONCURRENCY}
+S3_TRANSFER_SETTINGS: dict = {
+    "multipart_chunksize": MULTIPART_CHUNKSIZE,
+    "adaptive_chunksize": False,
+    "max_concurrency": TRANSFER_CONCURRENCY,
+    "max_inflight_bytes": None,
+}
+S3_CLIENTS: dict = {}
+S3_CLIENTS_LOCK = threading.Lock()
+
+# Shared by every worker, so the limits apply to the process as a whole
+RATE_LIMITER = RateLimiter()
+
 
 def str_to_bytes(convert_str: str) -> bytes:
     return convert_str.encode("utf-8")
@@ -49,8 +78,82 @@ def swap_path(filename: str, source: str, destination: str) -> str:
     return os.path.join(destination, os.path.relpath(filename, source))
 
 
+def configure_s3_clients(max_pool_connections: int) -> None:
+    with S3_CLIENTS_LOCK:
+        if S3_CLIENT_SETTINGS["max_pool_connections"] != max_pool_connections:
+            S3_CLIENT_SETTINGS["max_pool_connections"] = max_pool_connections
+            S3_CLIENTS.clear()
+
+
+def get_s3_client(endpoint: Union[str, None]):
+    # boto3 clients are thread-safe once created, but creating them is not,
+    # so one client (and connection pool) is shared per endpoint
+    with S3_CLIENTS_LOCK:
+        if endpoint not in S3_CLIENTS:
+            session = boto3.session.Session()
+            S3_CLIENTS[endpoint] = session.client(
+                "s3",
+                endpoint_url=endpoint,
+                config=Config(max_pool_connections=S3_CLIENT_SETTINGS["max_pool_connections"]),
+            )
+            # Every HTTP request, including each part of a multipart transfer and each retry
+            S3_CLIENTS[endpoint].meta.events.register("before-send.s3", RATE_LIMITER.throttle_request)
+        return S3_CLIENTS[endpoint]
+
+
+def configure_rate_limits(
+    max_bandwidth: Union[int, None], max_requests: Union[int, None], schedule: Union[list, None] = None
+) -> None:
+    RATE_LIMITER.configure(max_bandwidth, max_requests, schedule)
+
+
+def configure_s3_transfers(
+    multipart_chunksize: int,
+    adaptive_chunksize: bool,
+    max_concurrency: int,
+    max_inflight_bytes: Union[int, None],
+) -> None:
+    S3_TRANSFER_SETTINGS["multipart_chunksize"] = multipart_chunksize
+    S3_TRANSFER_SETTINGS["adaptive_chunksize"] = adaptive_chunksize
+    S3_TRANSFER_SETTINGS["max_concurrency"] = max_concurrency
+    S3_TRANSFER_SETTINGS["max_inflight_bytes"] = max_inflight_bytes
+
+
+def adaptive_multipart_chunksize(file_size: int) -> int:
+    chunksize = -(-file_size // ADAPTIVE_TARGET_PARTS)
+    chunksize = -(-chunksize // MIB) * MIB
+    return min(max(chunksize, MULTIPART_CHUNKSIZE), MAX_MULTIPART_CHUNKSIZE)
+
+
+def get_transfer_config(file_size: Union[int, None] = None) -> TransferConfig:
+    if S3_TRANSFER_SETTINGS["adaptive_chunksize"] and file_size is not None:
+        chunksize = adaptive_multipart_chunksize(file_size)
+    else:
+        chunksize = S3_TRANSFER_SETTINGS["multipart_chunksize"]
+    max_concurrency = S3_TRANSFER_SETTINGS["max_concurrency"]
+    max_inflight_bytes = S3_TRANSFER_SETTINGS["max_inflight_bytes"]
+    if max_inflight_bytes:
+        # upload_file and download_file hold one part in flight per thread, and
+        # s3transfer only applies its in-memory chunk limits to file objects
+        max_concurrency = min(max_concurrency, max(1, max_inflight_bytes // chunksize))
+    transfer_config = TransferConfig(
+        multipart_threshold=chunksize,
+        multipart_chunksize=chunksize,
+        max_concurrency=max_concurrency,
+    )
+    if max_inflight_bytes:
+        transfer_config.max_in_memory_upload_chunks = max(1, max_inflight_bytes // chunksize)
+        transfer_config.max_in_memory_download_chunks = max(1, max_inflight_bytes // transfer_config.io_chunksize)
+    return transfer_config
+
+
+def format_throughput(num_bytes: int, seconds: float) -> str:
+    rate = num_bytes / MIB / seconds if seconds > 0 else 0.0
+    return f"{num_bytes / MIB:.1f} MiB in {seconds:.1f}s, {rate:.1f} MiB/s"
+
+
 def s3_path_exists(s3_path: str, endpoint: Union[str, None]) -> bool:
-    s3_client = boto3.client("s3", endpoint_url=endpoint)
+    s3_client = get_s3_client(endpoint)
     bucket, key = parse_s3_url(s3_path)
     try:
         s3_client.head_object(Bucket=bucket, Key=key)
@@ -61,32 +164,73 @@ def s3_path_exists(s3_path: str, endpoint: Union[str, None]) -> bool:
     return True
 
 
-def upload_file_to_s3(source: str, destination: str, endpoint: Union[str, None]) -> None:
-    s3_client = boto3.client("s3", endpoint_url=endpoint)
+def list_s3_objects(s3_prefix: str, endpoint: Union[str, None]) -> dict:
+    s3_client = get_s3_client(endpoint)
+    bucket, prefix = parse_s3_url(s3_prefix)
+    paginator = s3_client.get_paginator("list_objects_v2")
+    objects = {}
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for s3_object in page.get("Contents", []):
+            objects[f"s3://{bucket}/{s3_object['Key']}"] = {
+                "size": s3_object["Size"],
+                "etag": s3_object["ETag"].strip('"'),
+            }
+    return objects
+
+
+def upload_file_to_s3(source: str, destination: str, endpoint: Union[str, None]) -> float:
+    s3_client = get_s3_client(endpoint)
     bucket, key = parse_s3_url(destination)
-    s3_client.upload_file(source, bucket, key)
+    start = time.monotonic()
+    s3_client.upload_file(
+        source,
+        bucket,
+        key,
+        Config=get_transfer_config(os.path.getsize(source)),
+        Callback=RATE_LIMITER.throttle_bytes,
+    )
+    return time.monotonic() - start
+
+
+def upload_fileobj_to_s3(fileobj: BinaryIO, size: int, destination: str, endpoint: Union[str, None]) -> float:
+    s3_client = get_s3_client(endpoint)
+    bucket, key = parse_s3_url(destination)
+    start = time.monotonic()
+    s3_client.upload_fileobj(
+        fileobj, bucket, key, Config=get_transfer_config(size), Callback=RATE_LIMITER.throttle_bytes
+    )
+    return time.monotonic() - start
 
 
 def upload_bytes_to_s3(data: bytes, destination: str, endpoint: Union[str, None]) -> None:
-    s3_client = boto3.client("s3", endpoint_url=endpoint)
+    s3_client = get_s3_client(endpoint)
     bucket, key = parse_s3_url(destination)
+    RATE_LIMITER.throttle_bytes(len(data))
     s3_client.put_object(Body=data, Bucket=bucket, Key=key)
 
 
-def download_file_from_s3(s3_path: str, local_path: str, endpoint: Union[str, None]) -> None:
-    s3_client = boto3.client("s3", endpoint_url=endpoint)
+def download_file_from_s3(
+    s3_path: str, local_path: str, endpoint: Union[str, None], size: Union[int, None] = None
+) -> float:
+    s3_client = get_s3_client(endpoint)
     bucket, key = parse_s3_url(s3_path)
-    s3_client.download_file(bucket, key, local_path)
+    start = time.monotonic()
+    s3_client.download_file(
+        bucket, key, local_path, Config=get_transfer_config(size), Callback=RATE_LIMITER.throttle_bytes
+    )
+    return time.monotonic() - start
 
 
 def download_bytes_from_s3(s3_path: str, endpoint: Union[str, None], version: Union[str, None] = None) -> bytes:
-    s3_client = boto3.client("s3", endpoint_url=endpoint)
+    s3_client = get_s3_client(endpoint)
     bucket, key = parse_s3_url(s3_path)
     if version:
         response = s3_client.get_object(Bucket=bucket, Key=key, VersionId=version)
     else:
         response = s3_client.get_object(Bucket=bucket, Key=key)
-    return response["Body"].read()
+    data = response["Body"].read()
+    RATE_LIMITER.throttle_bytes(len(data))
+    return data
 
 
 def local_path_exists(local_path: str) -> bool: